@@ -1,49 +1,93 @@
 """Utility for managing the Zookeeper connection for ZookeeperClient instances."""
 
+import atexit
+import os
 import threading
+from collections import OrderedDict
 from contextlib import ContextDecorator
+from types import SimpleNamespace
+from typing import Optional
 
 from kazoo.client import KazooClient as ZookeeperClient
 from kazoo.exceptions import ConnectionClosedError
+from kazoo.recipe.lock import Lock as ZookeeperLock
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 
 __all__ = ['zookeeper_connection_manager']
 
+# the maximum number of released kazoo locks kept for reuse by the client
+_IDLE_LOCKS_LIMIT = 1024
+
 
 class ZookeeperConnectionManager(ContextDecorator):
 
     """A context manager / decorator for managing the Zookeeper connection."""
 
-    # data holds objects shared among all instances of ZookeeperConnectionManager:
-    #  - client - the ZookeeperClient instance
-    #  - reference_counter - used to determine when to stop the client connection
+    # _shared holds objects shared among all threads and instances of ZookeeperConnectionManager:
+    #  - client - the ZookeeperClient instance, it's thread-safe so all the threads use the same Zookeeper session
+    #  - reference_counter - the number of threads in the managed context, used to determine when to stop the client connection
+    #  - restarted - the event set when the background restart of the client connection is finished
+    #  - hosts - the connection string built from settings.ZOOKEEPER_HOSTS when creating the first client
+    #  - idle_locks - the released kazoo locks of the client mapped by their paths, ordered from the least recently used
+    # _data holds the thread local reference_counter of the nested contexts used to determine if the thread is in the managed context
+    _shared = SimpleNamespace(client=None, reference_counter=0, restarted=None, hosts=None, idle_locks=OrderedDict())
     _data = threading.local()
     _data_lock = threading.Lock()
 
     def start_context(self, *args, **kwargs):
         """Increment the reference counter."""
-        with self._data_lock:
-            if not hasattr(self._data, 'reference_counter'):
-                self._data.reference_counter = 0
-            self._data.reference_counter += 1
+        reference_counter = getattr(self._data, 'reference_counter', 0)
+        if reference_counter == 0:
+            # only entering the outermost context of the thread changes the shared state
+            with self._data_lock:
+                self._shared.reference_counter += 1
+        self._data.reference_counter = reference_counter + 1
 
     def stop_context(self, *args, **kwargs):
-        """Decrement the reference counter and stop the connection while exiting the outermost context."""
-        with self._data_lock:
-            assert self.is_managed, 'Calling stop_context before start_context.'
-            self._data.reference_counter -= 1
-            if self._data.reference_counter == 0 and self.has_client:
-                self._stop_connection()
+        """Decrement the reference counter and stop the connection while exiting the outermost context of the last thread."""
+        if not self.is_managed:
+            raise RuntimeError('Calling stop_context before start_context.')
+        self._data.reference_counter -= 1
+        if self._data.reference_counter == 0:
+            with self._data_lock:
+                self._shared.reference_counter -= 1
+                if self._shared.reference_counter == 0 and self.has_client and not self.keep_alive:
+                    self._stop_connection()
 
     def get_client(self) -> ZookeeperClient:
         """Return a connected ZookeeperClient instance."""
+        if not self.is_managed:
+            raise RuntimeError('Use the zookeeper_locks.connection.ZookeeperConnectionManager as a context manager or decorator.')
+        client = self._shared.client
+        if client is None:
+            with self._data_lock:
+                if not self.has_client:
+                    self._start_connection()
+                client = self._shared.client
+        self._wait_for_restart()
+        return client
+
+    def take_idle_lock(self, path: str) -> Optional[ZookeeperLock]:
+        """Remove the released kazoo lock for the path from the pool and return it."""
         with self._data_lock:
-            assert self.is_managed, 'Use the zookeeper_locks.connection.ZookeeperConnectionManager as a context manager or decorator.'
-            if not self.has_client:
-                self._start_connection()
-            return self._data.client
+            return self._shared.idle_locks.pop(path, None)
+
+    def add_idle_lock(self, path: str, lock: ZookeeperLock):
+        """Put the released kazoo lock to the pool, evicting the least recently used one when it's full."""
+        # the released lock node doesn't exist anymore, the next acquire doesn't need to look for it
+        lock.create_tried = False
+        # the parent node may be removed meanwhile (e.g. pruned by the operators), make sure it exists on the next acquire
+        lock.assured_path = False
+        with self._data_lock:
+            idle_locks = self._shared.idle_locks
+            idle_locks[path] = lock
+            idle_locks.move_to_end(path)
+            if len(idle_locks) > _IDLE_LOCKS_LIMIT:
+                idle_locks.popitem(last=False)
 
     @property
     def is_managed(self) -> bool:
@@ -53,7 +97,12 @@ class ZookeeperConnectionManager(ContextDecorator):
     @property
     def has_client(self) -> bool:
         """Determine if the client has been created."""
-        return bool(getattr(self._data, 'client', None))
+        return self._shared.client is not None
+
+    @property
+    def keep_alive(self) -> bool:
+        """Determine if the connection should be reused after exiting the outermost context."""
+        return getattr(settings, 'ZOOKEEPER_CONNECTION_KEEPALIVE', False)
 
     def __enter__(self) -> 'ZookeeperConnectionManager':
         """Enter the context when the manager is used as a context manager or decorator."""
@@ -63,24 +112,86 @@ class ZookeeperConnectionManager(ContextDecorator):
     def __exit__(self, exc_type, *exc) -> bool:
         """Exit the context when the manager is used as a context manager or decorator."""
         self.stop_context()
-        if exc_type is ConnectionClosedError and self.has_client:
-            self._data.client.restart()
+        if exc_type is ConnectionClosedError:
+            self._restart_connection()
         return False
 
     def _start_connection(self):
         """Create a ZookeeperClient instance and establish a connection."""
-        self._data.client = self._create_client()
-        self._data.client.start()
+        self._shared.client = self._create_client()
+        self._shared.client.start()
+        if self.keep_alive:
+            # the connection is never stopped by the context, close it when the process exits
+            atexit.register(self._stop_client_at_exit, self._shared.client, os.getpid())
 
     def _stop_connection(self):
         """Stop the client connection and set the client attribute to None."""
-        self._data.client.stop()
-        self._data.client = None
+        self._wait_for_restart()
+        self._shared.client.stop()
+        self._shared.client = None
+        # the locks reference the stopped client, drop them along with it
+        self._shared.idle_locks = OrderedDict()
+
+    def _restart_connection(self):
+        """Restart the client connection in a background thread unless it is already being restarted."""
+        with self._data_lock:
+            if not self.has_client:
+                return
+            restarted = self._shared.restarted
+            if restarted is not None and not restarted.is_set():
+                return
+            restarted = self._shared.restarted = threading.Event()
+            threading.Thread(target=self._restart_client, args=(self._shared.client, restarted), daemon=True).start()
+
+    def _wait_for_restart(self):
+        """Block until the pending restart of the client connection is finished."""
+        restarted = self._shared.restarted
+        if restarted is not None and not restarted.is_set():
+            restarted.wait()
+
+    @staticmethod
+    def _stop_client_at_exit(client: ZookeeperClient, pid: int):
+        """Stop the client unless the exiting process is a fork of the one which started it."""
+        if os.getpid() == pid:
+            client.stop()
+
+    @staticmethod
+    def _restart_client(client: ZookeeperClient, restarted: threading.Event):
+        """Restart the given client and notify the waiting threads."""
+        try:
+            client.restart()
+        finally:
+            restarted.set()
 
     def _create_client(self) -> ZookeeperClient:
+        if self._shared.hosts is None:
+            self._shared.hosts = ','.join(settings.ZOOKEEPER_HOSTS)
         return ZookeeperClient(
-            hosts=','.join(settings.ZOOKEEPER_HOSTS),
+            hosts=self._shared.hosts,
         )
 
 
 zookeeper_connection_manager = ZookeeperConnectionManager()
+
+
+def _reset_after_fork():
+    """Drop the connection inherited from the parent process, the child creates its own client on demand."""
+    shared = ZookeeperConnectionManager._shared  # pylint: disable=protected-access
+    shared.client = None
+    shared.restarted = None
+    shared.idle_locks = OrderedDict()
+    # only the thread which forked the process survives in the child
+    shared.reference_counter = 1 if zookeeper_connection_manager.is_managed else 0
+    # the lock might have been held by another thread of the parent process while forking
+    ZookeeperConnectionManager._data_lock = threading.Lock()  # pylint: disable=protected-access
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@receiver(setting_changed)
+def reset_hosts(setting, **kwargs):  # pylint: disable=unused-argument
+    """Build the connection string again after changing the ZOOKEEPER_HOSTS setting (e.g. with override_settings)."""
+    if setting == 'ZOOKEEPER_HOSTS':
+        ZookeeperConnectionManager._shared.hosts = None  # pylint: disable=protected-access
@@ -1,25 +1,69 @@
 """Tools for creating distributed locks."""
 import os
-import threading
-from contextlib import contextmanager
+import sys
+from contextvars import ContextVar
 from functools import wraps
-from logging import getLogger
+from logging import (
+    INFO,
+    getLogger,
+)
+from time import monotonic
 from typing import (
     Any,
     Dict,
+    Mapping,
     Optional,
 )
+from weakref import WeakValueDictionary
 
 from kazoo.exceptions import LockTimeout as ZookeeperLockTimeout
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 from .connection import zookeeper_connection_manager
 
 
 logger = getLogger(__name__)
 
+# the PID only changes after forking, keep it cached instead of calling `os.getpid` for every lock
+_pid = os.getpid()
+
+
+def _update_pid():
+    """Refresh the cached PID in the forked child process."""
+    global _pid  # pylint: disable=global-statement
+    _pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_update_pid)
+
+
+class _LockHolder:
+
+    """Tracks a single acquisition of a Zookeeper lock."""
+
+    __slots__ = ('pid', 'held')
+
+    def __init__(self):
+        """Mark the lock as held by the current process."""
+        self.pid = _pid
+        self.held = True
+
+    @property
+    def is_held(self) -> bool:
+        """Check whether the acquisition is still in effect in the current process."""
+        return self.held and self.pid == _pid
+
+
+# Zookeeper paths of the locks acquired in the current context mapped to their holders, the context is inherited by
+# the code run on behalf of the lock owner (e.g. `asgiref.sync.sync_to_async`) and by the tasks which may outlive it,
+# so an inherited path counts as locked only while its holder is held; the mapping is never mutated, only replaced
+_locked_paths: 'ContextVar[Mapping[str, _LockHolder]]' = ContextVar('zookeeper_locks_locked_paths', default={})
+
 
 class LockTimeout(Exception):
 
@@ -55,83 +99,143 @@ class Lock:
     >>>     print('unable to lock immediately')
     """
 
-    # map key to lock object id
-    keys_registry: Dict[str, int] = dict()
+    __slots__ = ('key', '_is_static', '_namespace', '_path_prefix', '_static_path', '_slow_acquire_threshold', '__weakref__')
+
+    # map key to lock object, entries are dropped when the lock object is garbage collected
+    keys_registry: 'WeakValueDictionary[str, Lock]' = WeakValueDictionary()
 
     def __init__(self, key: str):
         """Register the given key and store it in the instance."""
         self.key = key
         self._register()
-        self._locked_store = threading.local()
-
-    def __del__(self):
-        """Unregister the key when destructing a lock."""
-        for key, value in self.keys_registry.items():
-            if value == id(self):
-                del self.keys_registry[key]
-                break
+        # keys without any placeholders always map to the same Zookeeper path
+        self._is_static = '{' not in key and '}' not in key
+        self._reset_settings()
 
     def _register(self):
         """Make sure the key has not been already used and add the key to the registry."""
-        if self.key in self.keys_registry:
+        if self.keys_registry.setdefault(self.key, self) is not self:
             raise ImproperlyConfigured('Attempt to register the same key twice: {}'.format(self.key))
-        self.keys_registry[self.key] = id(self)
-
-    @contextmanager
-    def __call__(self, blocking: bool = True, timeout: Optional[float] = None, **key_params: Any):
-        """Connect to Zookeeper and acquire the lock."""
-        self._setup_locked_store()
-        key_with_params = self._get_key_with_params(key_params)
-        if key_with_params in self._get_locked_keys():
-            yield
-        else:
-            with zookeeper_connection_manager:
-                zk = zookeeper_connection_manager.get_client()
-                lock = zk.Lock('/locks/{namespace}/{key}'.format(namespace=settings.ZOOKEEPER_APP_NAMESPACE, key=key_with_params))
-                logger.info('Acquiring lock', extra={"namespace": settings.ZOOKEEPER_APP_NAMESPACE, "key": key_with_params})
-                try:
-                    acquired = lock.acquire(blocking=blocking, timeout=timeout)
-                except ZookeeperLockTimeout as e:
-                    raise LockTimeout('Timeout occurred while trying to acquire a blocking lock on {}'.format(key_with_params)) from e
-                if acquired:
-                    try:
-                        self._add_locked_key(key_with_params)
-                        yield
-                    finally:
-                        lock.release()
-                        self._remove_locked_key(key_with_params)
-                if not acquired:
-                    raise Locked('Failed to acquire a non-blocking lock on {}'.format(key_with_params))
+
+    def _reset_settings(self):
+        """Forget the values derived from the settings, they are resolved when the lock is acquired for the first time."""
+        self._namespace = None
+        self._path_prefix = None
+        self._static_path = None
+        self._slow_acquire_threshold = None
+
+    def _resolve_settings(self) -> str:
+        """Build the Zookeeper paths and read the slow acquisition threshold from the settings, return the path prefix."""
+        namespace = settings.ZOOKEEPER_APP_NAMESPACE
+        path_prefix = '/locks/{}/'.format(namespace)
+        self._namespace = namespace
+        self._static_path = path_prefix + self.key if self._is_static else None
+        # acquisitions taking at least the given number of seconds are logged, None disables the measurement
+        self._slow_acquire_threshold = getattr(settings, 'ZOOKEEPER_LOCK_SLOW_ACQUIRE_THRESHOLD', None)
+        # set last, the settings are considered resolved once the prefix is set
+        self._path_prefix = path_prefix
+        return path_prefix
+
+    def __call__(self, blocking: bool = True, timeout: Optional[float] = None, **key_params: Any) -> '_LockContext':
+        """Return a context manager / decorator connecting to Zookeeper and acquiring the lock."""
+        return _LockContext(self, blocking, timeout, key_params)
 
     def _get_key_with_params(self, key_params: Dict[str, Any]) -> str:
         """Format key with the given parameters."""
+        if self._is_static:
+            return self.key
         return self.key.format(**key_params)
 
-    def _get_locked_keys(self):
-        """Returns Process Specific set of locked keys"""
-        pid = os.getpid()
-        return self._locked_store.locked_keys.get(pid) or set()
-
-    def _add_locked_key(self, key):
-        """Adds to Process Specific set of locked keys a given key"""
-        pid = os.getpid()
-        if pid not in self._locked_store.locked_keys:
-            self._locked_store.locked_keys[pid] = set()
-        self._locked_store.locked_keys[pid].add(key)
-
-    def _remove_locked_key(self, key):
-        """Removes a given key from Process Specific set of locked keys"""
-        pid = os.getpid()
-        if pid not in self._locked_store.locked_keys:
-            self._locked_store.locked_keys[pid] = set()
-        self._locked_store.locked_keys[pid].remove(key)
-
-    def _setup_locked_store(self):
+
+class _LockContext:
+
+    """A context manager / decorator acquiring the Zookeeper lock of the given Lock object."""
+
+    __slots__ = ('_lock', '_blocking', '_timeout', '_key_params', '_zk_path', '_zk_lock', '_holder', '_locked_paths_token')
+
+    def __init__(self, lock: Lock, blocking: bool, timeout: Optional[float], key_params: Dict[str, Any]):
+        """Store the lock call arguments."""
+        self._lock = lock
+        self._blocking = blocking
+        self._timeout = timeout
+        self._key_params = key_params
+        self._zk_lock = None
+
+    def __call__(self, fn):
+        """Decorate the function to be executed while holding the lock."""
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            """Acquire the lock in a new context for every call."""
+            with _LockContext(self._lock, self._blocking, self._timeout, self._key_params):
+                return fn(*args, **kwargs)
+        return inner
+
+    def __enter__(self):
+        """Acquire the lock unless it's already held in the current context."""
+        if self._zk_lock is not None:
+            # the state of the acquisition is kept in the instance, entering it again would release the lock on the inner exit
+            raise RuntimeError('The lock context has been already entered, call the lock again to get a new one.')
+        lock = self._lock
+        key_with_params = lock._get_key_with_params(self._key_params)  # pylint: disable=protected-access
+        path_prefix = lock._path_prefix  # pylint: disable=protected-access
+        if path_prefix is None:
+            path_prefix = lock._resolve_settings()  # pylint: disable=protected-access
+        zk_path = lock._static_path or path_prefix + key_with_params  # pylint: disable=protected-access
+        locked_paths = _locked_paths.get()
+        holder = locked_paths.get(zk_path)
+        if holder is not None and holder.is_held:
+            return
+        zookeeper_connection_manager.__enter__()
+        try:
+            zk = zookeeper_connection_manager.get_client()
+            # idle locks are removed from the pool while in use, so a single kazoo lock is never used by two threads at once
+            zk_lock = zookeeper_connection_manager.take_idle_lock(zk_path) or zk.Lock(zk_path)
+            if logger.isEnabledFor(INFO):
+                logger.info('Acquiring lock', extra={"namespace": lock._namespace, "key": key_with_params})  # pylint: disable=protected-access
+            slow_acquire_threshold = lock._slow_acquire_threshold  # pylint: disable=protected-access
+            if slow_acquire_threshold is not None:
+                started = monotonic()
+            try:
+                acquired = zk_lock.acquire(blocking=self._blocking, timeout=self._timeout)
+            except ZookeeperLockTimeout as e:
+                raise LockTimeout(f'Timeout occurred while trying to acquire a blocking lock on {key_with_params}') from e
+            finally:
+                # the attempts ending with a timeout are logged as well, they are the slowest ones
+                if slow_acquire_threshold is not None:
+                    duration = monotonic() - started
+                    if duration >= slow_acquire_threshold:
+                        logger.warning(
+                            'Slow lock acquisition: %.3fs', duration,
+                            extra={"namespace": lock._namespace, "key": key_with_params, "duration": duration},  # pylint: disable=protected-access
+                        )
+            if not acquired:
+                raise Locked(f'Failed to acquire a non-blocking lock on {key_with_params}')
+        except BaseException:
+            zookeeper_connection_manager.__exit__(*sys.exc_info())
+            raise
+        holder = self._holder = _LockHolder()
+        self._locked_paths_token = _locked_paths.set({**locked_paths, zk_path: holder})
+        self._zk_path = zk_path
+        self._zk_lock = zk_lock
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        """Release the lock acquired while entering the context."""
+        zk_lock = self._zk_lock
+        if zk_lock is None:
+            return False
+        self._zk_lock = None
+        self._holder.held = False
         try:
-            self._locked_store.locked_keys
-        except AttributeError:
-            # Dict of PID(int): Locked Keys(set) to avoid issues with forking memory
-            self._locked_store.locked_keys = dict()
+            try:
+                zk_lock.release()
+            finally:
+                _locked_paths.reset(self._locked_paths_token)
+            zookeeper_connection_manager.add_idle_lock(self._zk_path, zk_lock)
+        except BaseException:
+            zookeeper_connection_manager.__exit__(*sys.exc_info())
+            raise
+        zookeeper_connection_manager.__exit__(exc_type, exc_value, traceback)
+        return False
 
 
 def return_when_locked(return_value_when_locked: str = 'Locked'):
@@ -159,3 +263,11 @@ def return_when_locked(return_value_when_locked: str = 'Locked'):
                 return return_value_when_locked
         return inner
     return real_decorator
+
+
+@receiver(setting_changed)
+def reset_lock_settings(setting, **kwargs):  # pylint: disable=unused-argument
+    """Resolve the settings of the locks again after changing them (e.g. with override_settings)."""
+    if setting in ('ZOOKEEPER_APP_NAMESPACE', 'ZOOKEEPER_LOCK_SLOW_ACQUIRE_THRESHOLD'):
+        for lock in list(Lock.keys_registry.values()):
+            lock._reset_settings()  # pylint: disable=protected-access
@@ -25,22 +25,27 @@ class Command(BaseCommand):
         super(Command, self).__init__(*args, **kwarg)
 
     def launched_with_defaults(self, **options):
-        return (
-            all(not options.get(opt) for opt in ['settings', 'pythonpath', 'app_label', 'migration_name', 'fake', 'fake_initial', 'run_syncdb'])
-            and options.get('database') == 'default'
-        )
-
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.MIGRATE_HEADING("Potential data migration will be assisted by Zookeeper locks."))
+        if options.get('database') != 'default':
+            return False
+        for opt in ('settings', 'pythonpath', 'app_label', 'migration_name', 'fake', 'fake_initial', 'run_syncdb'):
+            if options.get(opt):
+                return False
+        return True
+
+    def has_unapplied_migrations(self):
         try:
             executor = MigrationExecutor(connection)
         except ImproperlyConfigured:
             # No databases are configured (or the dummy one)
-            has_unapplied_migrations = True  # let the superclass decide what to do
-        else:
-            has_unapplied_migrations = bool(executor.migration_plan(executor.loader.graph.leaf_nodes()))
+            return True  # let the superclass decide what to do
+        # every node of the graph is a dependency of some leaf node, so this is what the full migration plan would check
+        applied_migrations = executor.loader.applied_migrations
+        return any(node not in applied_migrations for node in executor.loader.graph.nodes)
 
-        if not self.launched_with_defaults(**options) or has_unapplied_migrations:
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING("Potential data migration will be assisted by Zookeeper locks."))
+        # the migration state is only checked for the defaults, all the other runs are executed in the critical section
+        if not self.launched_with_defaults(**options) or self.has_unapplied_migrations():
             if settings.ZOOKEEPER_HOSTS:
                 lock_ctx = self.lock
             else:
@@ -3,6 +3,7 @@ from io import StringIO
 
 from mock import patch
 
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.test import override_settings
 from django.test.testcases import TestCase
@@ -48,10 +49,43 @@ class MigrateWithZookeeperCommandTestCase(TestCase):
         nullcontext_mocked.assert_called_once()
         base_command_mocked.assert_called_once()
 
-    @patch('zookeeper_locks.management.commands.migrate_with_zookeeper.MigrationExecutor.migration_plan', return_value=False)
+    def test_launched_with_defaults(self):
+        command = migrate_with_zookeeper.Command()
+        self.assertTrue(command.launched_with_defaults(database='default', fake=False, app_label=None))
+        self.assertFalse(command.launched_with_defaults(database='other'))
+        self.assertFalse(command.launched_with_defaults(database='default', fake=True))
+        self.assertFalse(command.launched_with_defaults())
+
+    @patch('zookeeper_locks.management.commands.migrate_with_zookeeper.MigrationExecutor')
     @patch('zookeeper_locks.management.commands.migrate_with_zookeeper.Command.launched_with_defaults', return_value=True)
     @patch('django.core.management.commands.migrate.Command.handle')
-    def test_without_unapplied_migrations(self, base_command_mocked, *other_mocks):
+    def test_without_unapplied_migrations(self, base_command_mocked, launched_with_defaults_mocked, executor_mocked):
+        executor_mocked.return_value.loader.graph.nodes = {('app', '0001_initial'): None}
+        executor_mocked.return_value.loader.applied_migrations = {('app', '0001_initial'): None}
         command = migrate_with_zookeeper.Command()
         command.handle()
         base_command_mocked.assert_not_called()
+
+    @patch('zookeeper_locks.management.commands.migrate_with_zookeeper.MigrationExecutor')
+    @patch('zookeeper_locks.management.commands.migrate_with_zookeeper.Command.launched_with_defaults', return_value=True)
+    @patch('django.core.management.commands.migrate.Command.handle')
+    def test_with_unapplied_migrations(self, base_command_mocked, launched_with_defaults_mocked, executor_mocked):
+        executor_mocked.return_value.loader.graph.nodes = {('app', '0001_initial'): None, ('app', '0002_change'): None}
+        executor_mocked.return_value.loader.applied_migrations = {('app', '0001_initial'): None}
+        command = migrate_with_zookeeper.Command()
+        command.handle()
+        base_command_mocked.assert_called_once()
+
+    @patch('zookeeper_locks.management.commands.migrate_with_zookeeper.MigrationExecutor')
+    @patch('django.core.management.commands.migrate.Command.handle')
+    def test_skipping_migration_check_without_defaults(self, base_command_mocked, executor_mocked):
+        command = migrate_with_zookeeper.Command()
+        command.handle(database='other')
+        executor_mocked.assert_not_called()
+        base_command_mocked.assert_called_once()
+
+    @override_settings()
+    def test_creating_without_namespace(self):
+        del settings.ZOOKEEPER_APP_NAMESPACE
+        command = migrate_with_zookeeper.Command()
+        self.assertEqual(command.lock.key, 'migrations')
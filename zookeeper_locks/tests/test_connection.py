@@ -1,12 +1,23 @@
 """Tests for the ZookeeperConnectionManager class."""
 
-from unittest import mock
+import os
+import threading
+from unittest import (
+    mock,
+    skipUnless,
+)
 
 from kazoo.exceptions import ConnectionClosedError
 
-from django.test import TestCase
+from django.test import (
+    TestCase,
+    override_settings,
+)
 
-from zookeeper_locks.connection import zookeeper_connection_manager
+from zookeeper_locks.connection import (
+    ZookeeperConnectionManager,
+    zookeeper_connection_manager,
+)
 
 from .utils import FakeZookeeperClient
 
@@ -41,9 +52,9 @@ class ZookeeperConnectionManagerTestCase(TestCase):
         self.assertFalse(zookeeper_connection_manager.is_managed)
 
     def test_getting_client_out_of_context(self):
-        """Test that getting a client out of the manager context raises an AssertionError."""
+        """Test that getting a client out of the manager context raises a RuntimeError."""
         self.assertFalse(zookeeper_connection_manager.is_managed)
-        with self.assertRaises(AssertionError) as cm:
+        with self.assertRaises(RuntimeError) as cm:
             zookeeper_connection_manager.get_client()
         self.assertFalse(zookeeper_connection_manager.has_client)
         self.assertTupleEqual(
@@ -51,6 +62,12 @@ class ZookeeperConnectionManagerTestCase(TestCase):
             ('Use the zookeeper_locks.connection.ZookeeperConnectionManager as a context manager or decorator.', )
         )
 
+    def test_stopping_context_out_of_context(self):
+        """Test that stopping the context before starting it raises a RuntimeError."""
+        with self.assertRaises(RuntimeError) as cm:
+            zookeeper_connection_manager.stop_context()
+        self.assertTupleEqual(cm.exception.args, ('Calling stop_context before start_context.', ))
+
     def test_getting_client(self):
         """Test that using the connection manager creates and connects the ZookeeperClient when necessary."""
         fake_client = FakeZookeeperClient()
@@ -73,6 +90,107 @@ class ZookeeperConnectionManagerTestCase(TestCase):
                 zookeeper_connection_manager.get_client()
             start_mock.assert_has_calls([mock.call(), mock.call()])
 
+    def test_sharing_client_between_threads(self):
+        """Test that all the threads use the same client and the connection is stopped after the last thread exits the context."""
+        fake_client = FakeZookeeperClient()
+        thread_clients = []
+
+        @zookeeper_connection_manager
+        def get_client_in_thread():
+            """Store the client used by the thread."""
+            thread_clients.append(zookeeper_connection_manager.get_client())
+
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client) as create_client_mock:
+            with zookeeper_connection_manager:
+                self.assertIs(zookeeper_connection_manager.get_client(), fake_client)
+                thread = threading.Thread(target=get_client_in_thread)
+                thread.start()
+                thread.join()
+                self.assertListEqual(thread_clients, [fake_client])
+                self.assertTrue(fake_client.started)
+            self.assertFalse(fake_client.started)
+            create_client_mock.assert_called_once()
+
+    def test_pooling_idle_locks(self):
+        """Test that the pooled locks look for their nodes again when they are reused."""
+        lock = FakeZookeeperClient.Lock('/locks/app/key')
+        lock.create_tried = lock.assured_path = True
+        zookeeper_connection_manager.add_idle_lock('/locks/app/key', lock)
+        self.assertIs(zookeeper_connection_manager.take_idle_lock('/locks/app/key'), lock)
+        self.assertFalse(lock.create_tried)
+        self.assertFalse(lock.assured_path)
+        self.assertIsNone(zookeeper_connection_manager.take_idle_lock('/locks/app/key'))
+
+    @skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_resetting_client_after_fork(self):
+        """Test that the forked process doesn't use the client of the parent process and counts only the forking thread."""
+        fake_client = FakeZookeeperClient()
+        child_client = FakeZookeeperClient()
+        entered = threading.Event()
+        forked = threading.Event()
+
+        @zookeeper_connection_manager
+        def hold_context_in_thread():
+            """Keep the context of another thread active while forking."""
+            entered.set()
+            forked.wait()
+
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', side_effect=[fake_client, child_client]):
+            with zookeeper_connection_manager:
+                zookeeper_connection_manager.get_client()
+                thread = threading.Thread(target=hold_context_in_thread)
+                thread.start()
+                entered.wait()
+                pid = os.fork()
+                if pid == 0:
+                    exit_code = 1
+                    try:
+                        shared = ZookeeperConnectionManager._shared
+                        if not zookeeper_connection_manager.has_client and shared.reference_counter == 1:
+                            client = zookeeper_connection_manager.get_client()
+                            zookeeper_connection_manager.stop_context()
+                            if client is child_client and not child_client.started and shared.reference_counter == 0:
+                                exit_code = 0
+                    finally:
+                        os._exit(exit_code)  # pylint: disable=protected-access
+                forked.set()
+                thread.join()
+                _, status = os.waitpid(pid, 0)
+                self.assertEqual(status, 0)
+                self.assertIs(zookeeper_connection_manager.get_client(), fake_client)
+                self.assertTrue(fake_client.started)
+            self.assertFalse(fake_client.started)
+
+    @override_settings(ZOOKEEPER_CONNECTION_KEEPALIVE=True)
+    def test_keeping_client_alive(self):
+        """Test that the connection is reused between contexts when the keepalive is enabled."""
+        fake_client = FakeZookeeperClient()
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client, 'start', wraps=fake_client.start) as start_mock, \
+                mock.patch('zookeeper_locks.connection.atexit.register') as register_mock:
+            with zookeeper_connection_manager:
+                zookeeper_connection_manager.get_client()
+            self.assertTrue(zookeeper_connection_manager.has_client)
+            self.assertTrue(fake_client.started)
+            with zookeeper_connection_manager:
+                self.assertIs(zookeeper_connection_manager.get_client(), fake_client)
+            start_mock.assert_called_once()
+            register_mock.assert_called_once_with(ZookeeperConnectionManager._stop_client_at_exit, fake_client, os.getpid())
+        ZookeeperConnectionManager._stop_client_at_exit(fake_client, os.getpid() + 1)
+        self.assertTrue(fake_client.started)
+        zookeeper_connection_manager._stop_connection()
+        self.assertFalse(fake_client.started)
+
+    def test_creating_client(self):
+        """Test that the client is created with the hosts from the settings."""
+        with mock.patch('zookeeper_locks.connection.ZookeeperClient') as client_class_mock:
+            with override_settings(ZOOKEEPER_HOSTS=['zk1:2181', 'zk2:2181']):
+                ZookeeperConnectionManager()._create_client()
+                client_class_mock.assert_called_with(hosts='zk1:2181,zk2:2181')
+            with override_settings(ZOOKEEPER_HOSTS=['zk3:2181']):
+                ZookeeperConnectionManager()._create_client()
+                client_class_mock.assert_called_with(hosts='zk3:2181')
+
     def test_restarting_client(self):
         """Test that connection is restarted on ConnectionClosedError when it's needed."""
         fake_client = FakeZookeeperClient()
@@ -97,3 +215,17 @@ class ZookeeperConnectionManagerTestCase(TestCase):
                         raise ConnectionClosedError()
             restart_mock.assert_called_once()
 
+    def test_waiting_for_restarted_client(self):
+        """Test that getting a client waits until the connection restarted in the background is ready."""
+        fake_client = FakeZookeeperClient()
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client):
+            with zookeeper_connection_manager:
+                zookeeper_connection_manager.get_client()
+                with self.assertRaises(ConnectionClosedError):
+                    with zookeeper_connection_manager:
+                        raise ConnectionClosedError()
+                self.assertIs(zookeeper_connection_manager.get_client(), fake_client)
+                self.assertTrue(fake_client.restarted)
+                self.assertTrue(fake_client.started)
+            self.assertFalse(fake_client.started)
+
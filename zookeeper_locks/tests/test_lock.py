@@ -1,12 +1,20 @@
 """Tests for the Lock class."""
 
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from unittest import mock
 
 from kazoo.exceptions import LockTimeout as ZookeeperLockTimeout
 
 from django.core.exceptions import ImproperlyConfigured
-from django.test import TestCase
+from django.test import (
+    TestCase,
+    override_settings,
+)
 
+from zookeeper_locks.connection import zookeeper_connection_manager
 from zookeeper_locks.locks import (
     Lock,
     Locked,
@@ -15,14 +23,13 @@ from zookeeper_locks.locks import (
 )
 
 from .utils import (
-    FakeZookeeperClient,
+    FakeZookeeperClientTestCaseMixin,
+    ParametrizedTestMeta,
     parametrize,
-    parametrized_test_case,
 )
 
 
-@parametrized_test_case
-class LockTestCase(TestCase):
+class LockTestCase(FakeZookeeperClientTestCaseMixin, TestCase, metaclass=ParametrizedTestMeta):
 
     """Test the Lock class."""
 
@@ -42,7 +49,7 @@ class LockTestCase(TestCase):
         self.assertIn(lock1.key, Lock.keys_registry)
         self.assertIn(lock2.key, Lock.keys_registry)
         del lock1
-        self.assertNotIn('key1`', Lock.keys_registry)
+        self.assertNotIn('key1', Lock.keys_registry)
         self.assertIn(lock2.key, Lock.keys_registry)
 
     @parametrize(
@@ -57,7 +64,7 @@ class LockTestCase(TestCase):
     def test_locking(self, key, key_params, zookeeper_key, blocking, timeout):
         """Test successful lock scenarios."""
         lock = Lock(key)
-        fake_client = FakeZookeeperClient()
+        fake_client = self.fake_zookeeper_client
         self.assertFalse(fake_client.started)
         with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
                 mock.patch.object(fake_client.Lock, '__init__', return_value=None) as init_mock, \
@@ -80,7 +87,7 @@ class LockTestCase(TestCase):
     def test_locking_failed(self, blocking, timeout, acquire_exception, expected_exception, exception_message):
         """Test unsuccessful lock scenarios."""
         lock = Lock('key')
-        fake_client = FakeZookeeperClient()
+        fake_client = self.fake_zookeeper_client
         self.assertFalse(fake_client.started)
         with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
                 mock.patch.object(fake_client.Lock, '__init__', return_value=None) as init_mock, \
@@ -90,6 +97,8 @@ class LockTestCase(TestCase):
                 with lock(blocking=blocking, timeout=timeout):
                     self.fail('Should not be executed.')
             self.assertTupleEqual(cm.exception.args, (exception_message, ))
+            # the chained exception traceback references this frame, drop it so that the lock key is unregistered with the lock
+            del cm
             init_mock.assert_called_once_with('/locks/django-zookeeper-test-app/key')
             acquire_mock.assert_called_once_with(blocking=blocking, timeout=timeout)
             release_mock.assert_not_called()
@@ -99,7 +108,7 @@ class LockTestCase(TestCase):
     def test_nested_locks(self):
         """Test if nested locks are acquirable."""
         lock = Lock('key')
-        fake_client = FakeZookeeperClient()
+        fake_client = self.fake_zookeeper_client
         assert not fake_client.started
         with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
                 mock.patch.object(fake_client.Lock, '__init__', return_value=None) as init_mock, \
@@ -113,6 +122,195 @@ class LockTestCase(TestCase):
             acquire_mock.assert_called_once_with(blocking=False, timeout=None)
             release_mock.assert_called_once()
 
+    def test_changing_namespace(self):
+        """Test that the namespace is read from the settings when acquiring the lock, not when creating it."""
+        with override_settings(ZOOKEEPER_APP_NAMESPACE='other-app'):
+            lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, '__init__', return_value=None) as init_mock:
+            with lock():
+                pass
+            with override_settings(ZOOKEEPER_APP_NAMESPACE='other-app'):
+                with lock():
+                    pass
+            with lock():
+                pass
+        self.assertListEqual(init_mock.call_args_list, [
+            mock.call('/locks/django-zookeeper-test-app/key'),
+            mock.call('/locks/other-app/key'),
+            mock.call('/locks/django-zookeeper-test-app/key'),
+        ])
+
+    @override_settings(ZOOKEEPER_LOCK_SLOW_ACQUIRE_THRESHOLD=0)
+    def test_logging_slow_acquisition(self):
+        """Test that acquisitions reaching the configured threshold are logged."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                self.assertLogs('zookeeper_locks.locks', level='WARNING') as logs:
+            with lock():
+                pass
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].key, 'key')
+        self.assertGreaterEqual(logs.records[0].duration, 0)
+
+    def test_logging_slow_acquisition_timeout(self):
+        """Test that acquisitions timing out after reaching the threshold are logged and the threshold is read when locking."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, 'acquire', side_effect=ZookeeperLockTimeout), \
+                override_settings(ZOOKEEPER_LOCK_SLOW_ACQUIRE_THRESHOLD=0), \
+                self.assertLogs('zookeeper_locks.locks', level='WARNING') as logs:
+            with self.assertRaises(LockTimeout):
+                with lock(timeout=10.0):
+                    pass
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].key, 'key')
+
+    def test_releasing_failed(self):
+        """Test that the lock is no longer considered held by the current context when releasing fails."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, 'acquire', return_value=True) as acquire_mock, \
+                mock.patch.object(fake_client.Lock, 'release', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                with lock():
+                    pass
+            self.assertFalse(zookeeper_connection_manager.is_managed)
+            self.assertFalse(fake_client.started)
+            with self.assertRaises(RuntimeError):
+                with lock():
+                    pass
+            self.assertEqual(acquire_mock.call_count, 2)
+
+    def test_nested_locks_in_copied_context(self):
+        """Test that the lock is not acquired again by the code executed in the context copied from the lock owner."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+
+        def lock_again():
+            """Acquire the lock held by the caller."""
+            with lock(blocking=False):
+                pass
+
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, 'acquire', return_value=True) as acquire_mock, \
+                ThreadPoolExecutor(max_workers=1) as executor:
+            with lock(blocking=False):
+                executor.submit(copy_context().run, lock_again).result()
+            acquire_mock.assert_called_once_with(blocking=False, timeout=None)
+            executor.submit(lock_again).result()
+            self.assertEqual(acquire_mock.call_count, 2)
+
+    def test_locking_in_task_outliving_owner(self):
+        """Test that the lock is acquired again by the task which has inherited the context but locks after the owner released it."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+
+        async def lock_later():
+            """Acquire the lock once the task creator has released it."""
+            with lock(blocking=False):
+                pass
+
+        async def create_task():
+            """Create the task while holding the lock and wait for it after releasing the lock."""
+            with lock(blocking=False):
+                task = asyncio.create_task(lock_later())
+            await task
+
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, 'acquire', return_value=True) as acquire_mock:
+            asyncio.run(create_task())
+            self.assertEqual(acquire_mock.call_count, 2)
+
+    def test_reusing_zookeeper_locks(self):
+        """Test that the released Zookeeper locks are reused by the same client and the locks held by other threads are not."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+
+        def lock_in_thread():
+            """Acquire the lock held by the main thread."""
+            with lock():
+                pass
+
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, '__init__', return_value=None) as init_mock:
+            with zookeeper_connection_manager:
+                with lock():
+                    thread = threading.Thread(target=lock_in_thread)
+                    thread.start()
+                    thread.join()
+                self.assertEqual(init_mock.call_count, 2)
+                with lock():
+                    pass
+                self.assertEqual(init_mock.call_count, 2)
+            # the idle locks are dropped along with the stopped client
+            with lock():
+                pass
+            self.assertEqual(init_mock.call_count, 3)
+
+    @mock.patch('zookeeper_locks.connection._IDLE_LOCKS_LIMIT', 2)
+    def test_evicting_idle_zookeeper_locks(self):
+        """Test that the least recently used Zookeeper lock is dropped when there are too many idle locks."""
+        lock = Lock('key-{param}')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, '__init__', return_value=None) as init_mock:
+            with zookeeper_connection_manager:
+                for param in [1, 2, 1, 3]:
+                    with lock(param=param):
+                        pass
+                self.assertEqual(init_mock.call_count, 3)
+                with lock(param=1):
+                    pass
+                self.assertEqual(init_mock.call_count, 3)
+                with lock(param=2):
+                    pass
+                self.assertEqual(init_mock.call_count, 4)
+
+    def test_reentering_lock_context(self):
+        """Test that entering the same lock context object again while it's entered raises a RuntimeError."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, 'acquire', return_value=True) as acquire_mock, \
+                mock.patch.object(fake_client.Lock, 'release') as release_mock:
+            lock_context = lock()
+            with lock_context:
+                with self.assertRaises(RuntimeError) as cm:
+                    with lock_context:
+                        self.fail('Should not be executed.')
+                self.assertTupleEqual(cm.exception.args, ('The lock context has been already entered, call the lock again to get a new one.', ))
+                release_mock.assert_not_called()
+            release_mock.assert_called_once_with()
+            with lock_context:
+                pass
+            self.assertEqual(acquire_mock.call_count, 2)
+            self.assertEqual(release_mock.call_count, 2)
+
+    def test_decorating_function(self):
+        """Test that the lock is acquired for every call of the decorated function."""
+        lock = Lock('key')
+        fake_client = self.fake_zookeeper_client
+        with mock.patch('zookeeper_locks.locks.zookeeper_connection_manager._create_client', return_value=fake_client), \
+                mock.patch.object(fake_client.Lock, 'acquire', return_value=True) as acquire_mock, \
+                mock.patch.object(fake_client.Lock, 'release') as release_mock:
+
+            @lock(blocking=False)
+            def do_something():
+                """Check that the lock is held."""
+                self.assertTrue(fake_client.started)
+                return 'done'
+
+            self.assertEqual(do_something(), 'done')
+            self.assertEqual(do_something(), 'done')
+            self.assertEqual(acquire_mock.call_count, 2)
+            self.assertEqual(release_mock.call_count, 2)
+        self.assertFalse(fake_client.started)
+
 
 class ReturnWhenLockedTestCase(TestCase):
 
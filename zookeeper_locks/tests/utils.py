@@ -1,5 +1,6 @@
 """Utils for zookeeper utils tests."""
 
+from functools import partialmethod
 from typing import (
     Callable,
     Iterable,
@@ -22,11 +23,13 @@ class FakeZookeeperClient:
         def __init__(self, key):  # pylint: disable=unused-argument
             """Mock the original `__init__` method."""
 
-        def acquire(self, blocking=True, timeout=None):  # pylint: disable=unused-argument
+        @staticmethod
+        def acquire(blocking=True, timeout=None):  # pylint: disable=unused-argument
             """Mock the original `acquire` method."""
             return True
 
-        def release(self):
+        @staticmethod
+        def release():
             """Mock the original `release` method."""
 
     def __init__(self):
@@ -51,11 +54,38 @@ class FakeZookeeperClient:
         self.start()
 
 
+class FakeZookeeperClientTestCaseMixin:
+
+    """A TestCase mixin sharing a single FakeZookeeperClient among the test methods of the class.
+
+    The client is created once in `setUpClass` and its attributes are reset before every test. It's not created in `setUpTestData`,
+    the django.test.TestCase would deep copy it for every test.
+    """
+
+    fake_zookeeper_client: FakeZookeeperClient
+
+    @classmethod
+    def setUpClass(cls):
+        """Create the shared dummy client."""
+        super().setUpClass()
+        cls.fake_zookeeper_client = FakeZookeeperClient()
+
+    def setUp(self):
+        """Reset the dummy client attributes."""
+        super().setUp()
+        self.fake_zookeeper_client.started = self.fake_zookeeper_client.ever_started = self.fake_zookeeper_client.restarted = False
+
+
 def params_to_kwargs(params_names: Iterable, params: Iterable) -> dict:
     """Merge iterables of names and values to dict"""
     return dict(zip(params_names, params))
 
 
+def _default_suffix_func(**kwargs):
+    """Use params iterable index or dict key as test suffix"""
+    return kwargs['__suffix']
+
+
 def parametrize(params_names: Iterable, params: Union[Iterable, dict], custom_suffix_func: Optional[Callable]=None) -> Callable:
     """Decorator used to parametrize test method with supplied param_names.
 
@@ -64,6 +94,7 @@ def parametrize(params_names: Iterable, params: Union[Iterable, dict], custom_su
     To create custom tests suffixes supply custom_suffix_func which takes __cls argument (TestCase class) and all params of current test,
     should return string - custom suffix.
     """
+    params_names = tuple(params_names)
     assert not any(param_name.startswith('__') for param_name in params_names), "Param names can't start with __."
 
     if isinstance(params, dict):
@@ -72,7 +103,7 @@ def parametrize(params_names: Iterable, params: Union[Iterable, dict], custom_su
         params_list = enumerate(params)
 
     params = {k: params_to_kwargs(params_names, v) for k, v in params_list}
-    suffix_func = custom_suffix_func or (lambda **kwargs: kwargs['__suffix'])
+    suffix_func = custom_suffix_func or _default_suffix_func
 
     def decorator(func: Callable) -> Callable:
         """Decorator function"""
@@ -84,19 +115,40 @@ def parametrize(params_names: Iterable, params: Union[Iterable, dict], custom_su
     return decorator
 
 
-def parametrized_test_case(cls: Type[TestCase]) -> Type[TestCase]:
-    """Decorator for TestCase to enable use of parametrize decorator on its test methods"""
-    def test_wrapper(test: Callable, **kwargs):
-        """Create test executor"""
-        def test_executor(instance: TestCase):
-            """Execute test"""
-            return test(instance, **kwargs)
-        return test_executor
+class _ParametrizedTestMethod(partialmethod):
+
+    """Test method executing the parametrized test with the given params"""
 
+    def __get__(self, obj, cls=None):
+        """Bind the test and keep its docstring for the test description"""
+        test = super().__get__(obj, cls)
+        test.__doc__ = self.func.__doc__
+        return test
+
+
+def _add_parametrized_tests(cls: Type[TestCase]) -> Type[TestCase]:
+    """Replace parametrized test methods of the class with test methods executing them with each of the params"""
     for name, func in list(cls.__dict__.items()):
         if not getattr(func, 'is_parametrized', False):
             continue
         for suffix, params in func.params.items():
-            setattr(cls, '{}__{}'.format(name, func.suffix_func(__suffix=suffix, __cls=cls, **params)), test_wrapper(func, **params))
+            setattr(cls, '{}__{}'.format(name, func.suffix_func(__suffix=suffix, __cls=cls, **params)), _ParametrizedTestMethod(func, **params))
         delattr(cls, name)
     return cls
+
+
+class ParametrizedTestMeta(type):
+
+    """Metaclass for TestCase to enable use of parametrize decorator on test methods of its classes and their subclasses.
+
+    Test methods are generated once, right after creating the class, so that custom suffix functions get the class as __cls argument.
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        """Create the class and generate its parametrized test methods"""
+        return _add_parametrized_tests(super().__new__(mcs, name, bases, namespace, **kwargs))
+
+
+def parametrized_test_case(cls: Type[TestCase]) -> Type[TestCase]:
+    """Decorator for TestCase to enable use of parametrize decorator on its test methods"""
+    return _add_parametrized_tests(cls)